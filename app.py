@@ -1,9 +1,15 @@
+import hashlib
+import os
+import threading
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+import matplotlib
 import altair as alt
+from matplotlib import style
+from matplotlib.figure import Figure
 from matplotlib.ticker import MaxNLocator
+from numba import njit
 
 # Configuración de la página
 st.set_page_config(
@@ -11,173 +17,357 @@ st.set_page_config(
     layout="wide"
 )
 
-plt.style.use('ggplot')
+# Backend sin interfaz gráfica: las figuras solo se rasterizan para st.pyplot
+matplotlib.use('Agg')
+style.use('ggplot')
+# Simplificar trazos casi colineales antes de rasterizar líneas largas
+matplotlib.rcParams['path.simplify'] = True
+matplotlib.rcParams['path.simplify_threshold'] = 1.0
 
 # Título de la página
 st.title("Dashboard NBA")
 
-# Cargar datos
-@st.cache_data
-def cargar_datos():
-    df = pd.read_csv('nba_all_elo.csv')
+# Códigos de game_result: las categorías se fijan a ['L', 'W'] al leer el CSV
+TIPO_RESULTADO = pd.CategoricalDtype(['L', 'W'])
+CODIGO_DERROTA = 0
+CODIGO_VICTORIA = 1
+
+# Columnas del CSV que usa el dashboard y sus tipos
+TIPOS = {
+    'gameorder': 'int32',
+    'fran_id': 'category',
+    'opp_fran': 'category',
+    'game_result': TIPO_RESULTADO,
+    'is_playoffs': 'int8',
+    'year_id': 'int16',
+}
+COLUMNAS = list(TIPOS)
+
+# La copia en Parquet lleva en el nombre un hash de las columnas y sus tipos, así
+# un cambio de esquema genera un archivo nuevo en lugar de reutilizar el anterior
+ARCHIVO_PARQUET = 'nba_all_elo.{}.parquet'.format(
+    hashlib.sha1(repr(sorted(TIPOS.items())).encode()).hexdigest()[:12]
+)
+
+def leer_csv():
+    return pd.read_csv('nba_all_elo.csv', engine='pyarrow', usecols=COLUMNAS, dtype=TIPOS)
+
+# Leer la copia en Parquet si existe y está al día; si no, leer el CSV y
+# regenerarla. Si no se puede escribir (p. ej. directorio de solo lectura) se
+# usa directamente el DataFrame leído del CSV
+def leer_datos():
+    if (os.path.exists(ARCHIVO_PARQUET)
+            and os.path.getmtime(ARCHIVO_PARQUET) >= os.path.getmtime('nba_all_elo.csv')):
+        return pd.read_parquet(ARCHIVO_PARQUET, columns=COLUMNAS)
+
+    df = leer_csv()
+
+    # Escritura en un archivo temporal y reemplazo atómico: nunca queda un
+    # Parquet truncado con el nombre definitivo
+    temporal = f'{ARCHIVO_PARQUET}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        df.to_parquet(temporal, index=False)
+        os.replace(temporal, ARCHIVO_PARQUET)
+    except OSError:
+        if os.path.exists(temporal):
+            os.remove(temporal)
     return df
 
-# Intentar cargar los datos
-try:
-    df = cargar_datos()
-    datos_cargados = True
+# Cargar datos y preprocesar una sola vez. Se guarda con cache_resource para
+# devolver siempre el mismo objeto sin copiarlo: el DataFrame y los índices que
+# se devuelven son de solo lectura
+@st.cache_resource
+def cargar_datos():
+    df = leer_datos()
+    df = df.sort_values('gameorder', kind='stable').reset_index(drop=True)
+
+    años = np.sort(df['year_id'].unique()).tolist()
+    # Las categorías de ambas columnas ya contienen todos los equipos
+    equipos = df['fran_id'].cat.categories.union(df['opp_fran'].cat.categories).sort_values().tolist()
+
+    # Cada fila vista desde el lado de fran_id y desde el lado de opp_fran
+    # (con el resultado invertido), conservando su posición en df
+    posiciones = np.arange(len(df))
+    es_victoria = df['game_result'].cat.codes.values == CODIGO_VICTORIA
+    lados = pd.concat([
+        pd.DataFrame({'year_id': df['year_id'].values, 'equipo': df['fran_id'].astype(str).values,
+                      'is_playoffs': df['is_playoffs'].values, 'posicion': posiciones,
+                      'victorias': es_victoria, 'derrotas': ~es_victoria}),
+        pd.DataFrame({'year_id': df['year_id'].values, 'equipo': df['opp_fran'].astype(str).values,
+                      'is_playoffs': df['is_playoffs'].values, 'posicion': posiciones,
+                      'victorias': ~es_victoria, 'derrotas': es_victoria}),
+    ], ignore_index=True).sort_values('posicion', kind='stable')
+    grupos = lados.groupby(['year_id', 'equipo', 'is_playoffs'])
+
+    # Filas de df de cada (año, equipo, playoffs), en orden cronológico
+    posiciones_lados = lados['posicion'].values
+    indices_selección = {
+        (int(año), equipo, int(playoffs)): posiciones_lados[filas]
+        for (año, equipo, playoffs), filas in grupos.indices.items()
+    }
+
+    # Victorias y derrotas por (año, equipo, playoffs)
+    agregados = grupos[['victorias', 'derrotas']].sum()
+    resumen = {
+        (int(año), equipo, int(playoffs)): (int(victorias), int(derrotas))
+        for (año, equipo, playoffs), victorias, derrotas in zip(
+            agregados.index, agregados['victorias'], agregados['derrotas']
+        )
+    }
+    return df, años, equipos, indices_selección, resumen
+
+# Resultado del equipo y conteos acumulados en una sola pasada sobre los
+# códigos de fran_id y game_result
+@njit(cache=True)
+def resultado_acumulado(franquicias, codigo_equipo, resultados):
+    n = resultados.size
+    resultado_equipo = np.empty(n, dtype=np.int8)
+    victorias_acumuladas = np.empty(n, dtype=np.int32)
+    derrotas_acumuladas = np.empty(n, dtype=np.int32)
+    victorias = 0
+    derrotas = 0
+    for i in range(n):
+        if franquicias[i] == codigo_equipo:
+            resultado = resultados[i]
+        elif resultados[i] == CODIGO_VICTORIA:
+            resultado = CODIGO_DERROTA
+        else:
+            resultado = CODIGO_VICTORIA
+        resultado_equipo[i] = resultado
+        if resultado == CODIGO_VICTORIA:
+            victorias += 1
+        else:
+            derrotas += 1
+        victorias_acumuladas[i] = victorias
+        derrotas_acumuladas[i] = derrotas
+    return resultado_equipo, victorias_acumuladas, derrotas_acumuladas
+
+# Valores de is_playoffs que corresponden a cada tipo de partido
+def valores_playoffs(tipo_partido):
+    if tipo_partido == "Ambos":
+        return [0, 1]
+    if tipo_partido == "Playoffs":
+        return [1]
+    return [0]
+
+# Filtrar datos para una combinación de año, equipo y tipo de partido
+@st.cache_data
+def filtrar_datos(año, equipo, tipo_partido):
+    df, _, _, indices_selección, _ = cargar_datos()
 
-except Exception as e:
-    st.error(f"Error al cargar los datos: {e}")
-    st.error("Asegúrate de que el archivo 'nba_all_elo.csv' esté en el mismo directorio que esta app.")
-    datos_cargados = False
+    claves = valores_playoffs(tipo_partido)
 
-if datos_cargados:
-    # Sidebar
-    st.sidebar.header("Filtros")
+    # Posiciones precalculadas en la carga; sin recorrer el DataFrame completo
+    vacio = np.array([], dtype=np.intp)
+    filas = np.sort(np.concatenate(
+        [indices_selección.get((año, equipo, playoffs), vacio) for playoffs in claves]
+    ))
+    df_filtrado = df.take(filas)
 
-    # Filtro por año
-    años = sorted(df['year_id'].unique().tolist())
-    año_seleccionado = st.sidebar.selectbox("Selecciona el año", años)
+    # Resultado desde el punto de vista del equipo seleccionado
+    franquicias = df_filtrado['fran_id'].cat
+    codigo_equipo = franquicias.categories.get_indexer([equipo])[0]
 
-    # Filtro por equipo
-    equipos = sorted(set(df['fran_id'].unique()) | set(df['opp_fran'].unique()))
-    equipo_seleccionado = st.sidebar.selectbox("Selecciona el equipo", equipos)
+    resultado_equipo, victorias_acumuladas, derrotas_acumuladas = resultado_acumulado(
+        franquicias.codes.values, codigo_equipo, df_filtrado['game_result'].cat.codes.values
+    )
+    df_filtrado['resultado_equipo'] = pd.Categorical.from_codes(resultado_equipo, dtype=TIPO_RESULTADO)
+    df_filtrado['victorias_acumuladas'] = victorias_acumuladas
+    df_filtrado['derrotas_acumuladas'] = derrotas_acumuladas
 
-    # Filtro por tipo de partido
-    opciones_tipo = ["Temporada regular", "Playoffs", "Ambos"]
-    tipo_partido = st.sidebar.radio("Selecciona el tipo de partido", opciones_tipo, key="tipo_partido")
+    df_filtrado = df_filtrado.reset_index(drop=True)
+    df_filtrado['numero_partido'] = np.arange(1, len(df_filtrado) + 1, dtype=np.int32)
+    return df_filtrado
+
+# Progresión de victorias y derrotas para los gráficos de líneas, tomada de los
+# acumulados que ya calcula resultado_acumulado (sin dividir el DataFrame)
+@st.cache_data
+def datos_lineas(año, equipo, tipo_partido):
+    df_filtrado = filtrar_datos(año, equipo, tipo_partido)
+
+    es_victoria = df_filtrado['resultado_equipo'].cat.codes.values == CODIGO_VICTORIA
+    numero_partido = df_filtrado['numero_partido'].values
+    n_victorias = int(np.count_nonzero(es_victoria))
+
+    return pd.DataFrame({
+        'Partido': np.concatenate([numero_partido[es_victoria], numero_partido[~es_victoria]]),
+        'Cantidad': np.concatenate([df_filtrado['victorias_acumuladas'].values[es_victoria],
+                                    df_filtrado['derrotas_acumuladas'].values[~es_victoria]]),
+        'Tipo': np.repeat(['Victorias', 'Derrotas'], [n_victorias, es_victoria.size - n_victorias])
+    })
+
+# Victorias y derrotas de la selección a partir del resumen precalculado
+def conteo_resultados(año, equipo, tipo_partido):
+    _, _, _, _, resumen = cargar_datos()
+
+    claves = valores_playoffs(tipo_partido)
+
+    victorias = derrotas = 0
+    for playoffs in claves:
+        v, d = resumen.get((año, equipo, playoffs), (0, 0))
+        victorias += v
+        derrotas += d
+    return victorias, derrotas
+
+# Figuras de Matplotlib que se conservan como máximo por función: cada figura
+# ya dibujada retiene el búfer de Agg, así que la caché debe estar acotada.
+# Cada figura se guarda con su propio cerrojo, porque las figuras en caché se
+# comparten entre sesiones y una misma figura no se puede dibujar dos veces a la vez
+MAX_FIGURAS = 32
+
+# Figura de Matplotlib reutilizada mientras no cambie la selección
+@st.cache_resource(max_entries=MAX_FIGURAS)
+def figura_lineas(año, equipo, tipo_partido):
+    datos = datos_lineas(año, equipo, tipo_partido)
+
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+
+    for tipo, color in (('Victorias', 'green'), ('Derrotas', 'red')):
+        serie = datos[datos['Tipo'] == tipo]
+        if not serie.empty:
+            ax.plot(serie['Partido'], serie['Cantidad'],
+                    marker='o', linestyle='-', color=color, label=tipo)
+
+    ax.set_xlabel('Número de partido')
+    ax.set_ylabel('Cantidad acumulada')
+    ax.set_title(f'Progresión de victorias y derrotas de {equipo} ({año})')
+    ax.legend()
+    ax.grid(True, linestyle='--', alpha=0.7)
+    ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+    ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+    return fig, threading.Lock()
+
+# Figura circular de Matplotlib reutilizada mientras no cambie la selección
+@st.cache_resource(max_entries=MAX_FIGURAS)
+def figura_pie(año, equipo, tipo_partido):
+    victorias, derrotas = conteo_resultados(año, equipo, tipo_partido)
+
+    fig = Figure(figsize=(5, 5))
+    ax = fig.subplots()
+    etiquetas = ['Victorias', 'Derrotas']
+    tamaños = [victorias, derrotas]
+    colores = ['green', 'red']
+    explotar = (0.1, 0)
+
+    ax.pie(tamaños, explode=explotar, labels=etiquetas, colors=colores,
+           autopct='%1.1f%%', shadow=True, startangle=90)
+    ax.axis('equal')
+    ax.set_title(f'Porcentaje de victorias y derrotas de {equipo} ({año})')
+    return fig, threading.Lock()
+
+# Filtros y gráficos en un fragmento: al cambiar un filtro solo se vuelve a
+# ejecutar esta función, no todo el script
+@st.fragment
+def mostrar_dashboard(años, equipos):
+    st.header("Filtros")
+    col_año, col_equipo, col_tipo = st.columns(3)
 
-    # Filtros
-    filtro_año = df['year_id'] == año_seleccionado
-    filtro_equipo = (df['fran_id'] == equipo_seleccionado) | (df['opp_fran'] == equipo_seleccionado)
+    # Filtro por año
+    with col_año:
+        año_seleccionado = st.selectbox("Selecciona el año", años)
 
-    df_filtrado = df[filtro_año & filtro_equipo].copy()
+    # Filtro por equipo
+    with col_equipo:
+        equipo_seleccionado = st.selectbox("Selecciona el equipo", equipos)
 
-    if tipo_partido != "Ambos":
-        if tipo_partido == "Playoffs":
-            df_filtrado = df_filtrado[df_filtrado['is_playoffs'] == 1]
-        else:
-            df_filtrado = df_filtrado[df_filtrado['is_playoffs'] == 0]
+    # Filtro por tipo de partido
+    with col_tipo:
+        opciones_tipo = ["Temporada regular", "Playoffs", "Ambos"]
+        tipo_partido = st.radio("Selecciona el tipo de partido", opciones_tipo, key="tipo_partido",
+                                horizontal=True)
 
-    if 'date_game' in df_filtrado.columns:
-        df_filtrado['date_game'] = pd.to_datetime(df_filtrado['date_game'])
-        df_filtrado = df_filtrado.sort_values('date_game')
+    # Los gráficos de Matplotlib son los más costosos de generar; solo bajo demanda
+    mostrar_matplotlib = st.checkbox("Mostrar también la versión Matplotlib", value=False)
 
-    df_filtrado['es_equipo'] = df_filtrado['fran_id'] == equipo_seleccionado
-    df_filtrado['resultado_equipo'] = df_filtrado.apply(
-        lambda fila: fila['game_result'] if fila['es_equipo'] else
-        ('W' if fila['game_result'] == 'L' else 'L'),
-        axis=1
-    )
+    df_filtrado = filtrar_datos(año_seleccionado, equipo_seleccionado, tipo_partido)
 
-    df_filtrado = df_filtrado.reset_index(drop=True)
-    df_filtrado['numero_partido'] = range(1, len(df_filtrado) + 1)
+    # Sin partidos no hay nada que calcular ni dibujar
+    if df_filtrado.empty:
+        st.warning("No hay datos disponibles para los filtros seleccionados.")
+        return
 
     col1, col2 = st.columns([2, 1])
 
     with col1:
         st.subheader(f"Victorias y derrotas acumuladas de {equipo_seleccionado} ({año_seleccionado})")
 
-        if not df_filtrado.empty:
-            victorias = df_filtrado[df_filtrado['resultado_equipo'] == 'W'].copy()
-            derrotas = df_filtrado[df_filtrado['resultado_equipo'] == 'L'].copy()
-
-            fig, ax = plt.subplots(figsize=(10, 6))
-
-            if not victorias.empty:
-                victorias = victorias.sort_values('numero_partido')
-                victorias['victorias_acumuladas'] = range(1, len(victorias) + 1)
-                ax.plot(victorias['numero_partido'], victorias['victorias_acumuladas'],
-                        marker='o', linestyle='-', color='green', label='Victorias')
-
-            if not derrotas.empty:
-                derrotas = derrotas.sort_values('numero_partido')
-                derrotas['derrotas_acumuladas'] = range(1, len(derrotas) + 1)
-                ax.plot(derrotas['numero_partido'], derrotas['derrotas_acumuladas'],
-                        marker='o', linestyle='-', color='red', label='Derrotas')
-
-            ax.set_xlabel('Número de partido')
-            ax.set_ylabel('Cantidad acumulada')
-            ax.set_title(f'Progresión de victorias y derrotas de {equipo_seleccionado} ({año_seleccionado})')
-            ax.legend()
-            ax.grid(True, linestyle='--', alpha=0.7)
-            ax.xaxis.set_major_locator(MaxNLocator(integer=True))
-            ax.yaxis.set_major_locator(MaxNLocator(integer=True))
-
-            st.pyplot(fig)
-
-            # Gráfico interactivo con Altair
-            if not victorias.empty:
-                datos_victorias = pd.DataFrame({
-                    'Partido': victorias['numero_partido'],
-                    'Cantidad': victorias['victorias_acumuladas'],
-                    'Tipo': ['Victorias'] * len(victorias)
-                })
-            else:
-                datos_victorias = pd.DataFrame(columns=['Partido', 'Cantidad', 'Tipo'])
-
-            if not derrotas.empty:
-                datos_derrotas = pd.DataFrame({
-                    'Partido': derrotas['numero_partido'],
-                    'Cantidad': derrotas['derrotas_acumuladas'],
-                    'Tipo': ['Derrotas'] * len(derrotas)
-                })
-            else:
-                datos_derrotas = pd.DataFrame(columns=['Partido', 'Cantidad', 'Tipo'])
-
-            datos_grafico = pd.concat([datos_victorias, datos_derrotas])
-
-            if not datos_grafico.empty:
-                grafico = alt.Chart(datos_grafico).mark_line(point=True).encode(
-                    x='Partido:Q',
-                    y='Cantidad:Q',
-                    color=alt.Color('Tipo:N', scale=alt.Scale(domain=['Victorias', 'Derrotas'], range=['green', 'red'])),
-                    tooltip=['Partido', 'Cantidad', 'Tipo']
-                ).properties(
-                    width=600,
-                    height=300
-                ).interactive()
-
-                st.altair_chart(grafico, use_container_width=True)
-        else:
-            st.write("No hay datos disponibles para los filtros seleccionados.")
+        if mostrar_matplotlib:
+            fig, bloqueo = figura_lineas(año_seleccionado, equipo_seleccionado, tipo_partido)
+            with bloqueo:
+                st.pyplot(fig, clear_figure=False)
+
+        # Gráfico interactivo con Altair
+        datos_grafico = datos_lineas(año_seleccionado, equipo_seleccionado, tipo_partido)
+
+        if not datos_grafico.empty:
+            grafico = alt.Chart(datos_grafico).mark_line(point=True).encode(
+                x='Partido:Q',
+                y='Cantidad:Q',
+                color=alt.Color('Tipo:N', scale=alt.Scale(domain=['Victorias', 'Derrotas'], range=['green', 'red'])),
+                tooltip=['Partido', 'Cantidad', 'Tipo']
+            ).properties(
+                width=600,
+                height=300
+            ).interactive()
+
+            st.altair_chart(grafico, use_container_width=True)
 
     with col2:
         st.subheader(f"Distribución de victorias y derrotas de {equipo_seleccionado} ({año_seleccionado})")
 
-        if not df_filtrado.empty:
-            conteo = df_filtrado['resultado_equipo'].value_counts()
-            victorias = conteo.get('W', 0)
-            derrotas = conteo.get('L', 0)
-            total = victorias + derrotas
-
-            if total > 0:
-                fig, ax = plt.subplots(figsize=(5, 5))
-                etiquetas = ['Victorias', 'Derrotas']
-                tamaños = [victorias, derrotas]
-                colores = ['green', 'red']
-                explotar = (0.1, 0)
-
-                ax.pie(tamaños, explode=explotar, labels=etiquetas, colors=colores,
-                       autopct='%1.1f%%', shadow=True, startangle=90)
-                ax.axis('equal')
-                ax.set_title(f'Porcentaje de victorias y derrotas de {equipo_seleccionado} ({año_seleccionado})')
-
-                st.pyplot(fig)
-
-                st.metric("Total de partidos", total)
-                col_vic, col_der = st.columns(2)
-                with col_vic:
-                    st.metric("Victorias", victorias)
-                    st.metric("Porcentaje de victorias", f"{(victorias / total * 100):.1f}%")
-                with col_der:
-                    st.metric("Derrotas", derrotas)
-                    st.metric("Porcentaje de derrotas", f"{(derrotas / total * 100):.1f}%")
-            else:
-                st.write("No se encontraron resultados claros para los filtros seleccionados.")
+        victorias, derrotas = conteo_resultados(año_seleccionado, equipo_seleccionado, tipo_partido)
+        total = victorias + derrotas
+
+        if total > 0:
+            etiquetas = ['Victorias', 'Derrotas']
+            tamaños = [victorias, derrotas]
+            colores = ['green', 'red']
+
+            # Gráfico circular con Altair
+            datos_pie = pd.DataFrame({
+                'Resultado': etiquetas,
+                'Cantidad': tamaños,
+                'Porcentaje': [victorias / total * 100, derrotas / total * 100]
+            })
+            grafico_pie = alt.Chart(datos_pie).mark_arc().encode(
+                theta='Cantidad:Q',
+                color=alt.Color('Resultado:N', scale=alt.Scale(domain=etiquetas, range=colores)),
+                tooltip=['Resultado', 'Cantidad', alt.Tooltip('Porcentaje:Q', format='.1f')]
+            ).properties(
+                title=f'Porcentaje de victorias y derrotas de {equipo_seleccionado} ({año_seleccionado})'
+            )
+
+            st.altair_chart(grafico_pie, use_container_width=True)
+
+            if mostrar_matplotlib:
+                fig, bloqueo = figura_pie(año_seleccionado, equipo_seleccionado, tipo_partido)
+                with bloqueo:
+                    st.pyplot(fig, clear_figure=False)
+
+            st.metric("Total de partidos", total)
+            col_vic, col_der = st.columns(2)
+            with col_vic:
+                st.metric("Victorias", victorias)
+                st.metric("Porcentaje de victorias", f"{(victorias / total * 100):.1f}%")
+            with col_der:
+                st.metric("Derrotas", derrotas)
+                st.metric("Porcentaje de derrotas", f"{(derrotas / total * 100):.1f}%")
         else:
-            st.write("No hay datos disponibles para los filtros seleccionados.")
+            st.write("No se encontraron resultados claros para los filtros seleccionados.")
+
+# Intentar cargar los datos
+try:
+    _, años, equipos, _, _ = cargar_datos()
+    datos_cargados = True
+
+except Exception as e:
+    st.error(f"Error al cargar los datos: {e}")
+    st.error("Asegúrate de que el archivo 'nba_all_elo.csv' esté en el mismo directorio que esta app.")
+    datos_cargados = False
+
+if datos_cargados:
+    mostrar_dashboard(años, equipos)
 
     # Pie de página
     st.markdown("---")